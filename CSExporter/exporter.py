@@ -7,11 +7,25 @@ Opção 3: Sair.
 O ambiente virtual deve estar ativado antes de rodar.
 """
 
-import subprocess
+import bisect
+import importlib
+import io
+import multiprocessing
+import re
 import sys
 import os
-import json
 import readline
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from contextlib import redirect_stdout
+from dotenv import load_dotenv
+
+try:
+    import orjson
+    loads = orjson.loads
+    def dumps(obj):
+        return orjson.dumps(obj).decode()
+except ImportError:
+    from json import loads, dumps
 
 # Mapeamento entre opções e scripts com caminhos relativos
 options = {
@@ -28,27 +42,74 @@ options = {
 }
 
 ENV_FILE = ".env"
-completer_options = []
+EXPORT_ALL_WORKERS = 4  # Exports executados em paralelo (um processo cada) no Export All
+
+# URLs da API por cloud e opções aceitas no prompt de cloud
+FALCON_BASE_URLS = {
+    "us-1": "https://api.crowdstrike.com",
+    "us-2": "https://api.us-2.crowdstrike.com",
+}
+CLOUD_CHOICES = {"1": "us-1", "2": "us-2"}
+
+# Uma linha CHAVE=valor do .env (espaços nas pontas são descartados)
+_ENV_RE = re.compile(r"^[ \t]*([^=\n]*?)[ \t]*=[ \t]*(.*?)[ \t]*$", re.M)
+
+# Cache do .env (CLIENT_CONFIGS e demais variáveis), invalidado quando o mtime do arquivo muda
+_CACHE = {"mtime": None, "data": None}
+
+def _update_cache(client_configs, env_vars):
+    _CACHE["mtime"] = os.stat(ENV_FILE).st_mtime_ns
+    _CACHE["data"] = (client_configs, env_vars)
+
+def load_env():
+    """
+    Lê o .env uma única vez e retorna (client_configs, env_vars), onde:
+    - client_configs = dict decodificado de CLIENT_CONFIGS
+    - env_vars = demais variáveis do arquivo (chave=valor)
+    """
+    if not os.path.isfile(ENV_FILE):
+        return {}, {}
+    if _CACHE["data"] is not None and _CACHE["mtime"] == os.stat(ENV_FILE).st_mtime_ns:
+        return _CACHE["data"]
 
-def load_client_configs():
     client_configs = {}
-    if os.path.isfile(ENV_FILE):
-        with open(ENV_FILE, "r", encoding="utf-8") as f:
-            for line in f:
-                line = line.strip()
-                if line.startswith("CLIENT_CONFIGS="):
-                    config_str = line.split("CLIENT_CONFIGS=", 1)[1]
-                    if config_str:
-                        try:
-                            client_configs = json.loads(config_str)
-                        except json.JSONDecodeError:
-                            print("Erro ao decodificar CLIENT_CONFIGS. O arquivo .env pode estar corrompido.")
-                            client_configs = {}
-    return client_configs
+    env_vars = {}
+    with open(ENV_FILE, "r", encoding="utf-8") as f:
+        content = f.read()
+    for key, value in _ENV_RE.findall(content):
+        if key == "CLIENT_CONFIGS":
+            if value:
+                try:
+                    client_configs = loads(value)
+                except ValueError:
+                    print("Erro ao decodificar CLIENT_CONFIGS. O arquivo .env pode estar corrompido.")
+                    client_configs = {}
+        else:
+            env_vars[key] = value
+    _update_cache(client_configs, env_vars)
+    return client_configs, env_vars
+
+def load_client_configs():
+    return load_env()[0]
+
+def _write_env(content):
+    # Grava tudo de uma vez em um arquivo temporário e substitui o .env (troca atômica).
+    # O .env guarda os secrets de todos os clientes: o temporário é criado com permissão 0600
+    # e recebe a permissão do .env atual, se houver, para a troca não ampliar o acesso
+    tmp_file = f"{ENV_FILE}.tmp"
+    try:
+        mode = os.stat(ENV_FILE).st_mode & 0o777
+    except OSError:
+        mode = 0o600
+    fd = os.open(tmp_file, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with os.fdopen(fd, "w", encoding="utf-8") as f:
+        f.write(content)
+    os.chmod(tmp_file, mode)
+    os.replace(tmp_file, ENV_FILE)
 
 def save_client_configs(client_configs):
-    with open(ENV_FILE, "w", encoding="utf-8") as f:
-        f.write(f"CLIENT_CONFIGS={json.dumps(client_configs)}\n")
+    _write_env(f"CLIENT_CONFIGS={dumps(client_configs)}\n")
+    _update_cache(client_configs, {})
 
 def update_env_for_client(client_name, client_configs):
     config = client_configs.get(client_name)
@@ -56,54 +117,61 @@ def update_env_for_client(client_name, client_configs):
         print("Cliente não encontrado.")
         return False
 
-    # Carrega o conteúdo atual do .env para preservar CLIENT_CONFIGS
-    current_content = {}
-    if os.path.isfile(ENV_FILE):
-        with open(ENV_FILE, "r", encoding="utf-8") as f:
-            for line in f:
-                line = line.strip()
-                if "=" in line and not line.startswith("CLIENT_CONFIGS="):
-                    key, value = line.split("=", 1)
-                    current_content[key.strip()] = value.strip()
-
-    # Atualiza apenas as configurações ativas, mantendo CLIENT_CONFIGS
-    env_content = [
-        f"FALCON_CLIENT_ID={config['FALCON_CLIENT_ID']}",
-        f"FALCON_CLIENT_SECRET={config['FALCON_CLIENT_SECRET']}",
-        f"FALCON_BASE_URL={config['FALCON_BASE_URL']}",
-        f"CLIENT_NAME={client_name}",
-    ]
-    env_content.extend([f"{k}={v}" for k, v in current_content.items() if k not in ["FALCON_CLIENT_ID", "FALCON_CLIENT_SECRET", "FALCON_BASE_URL", "CLIENT_NAME"]])
+    # Atualiza apenas as configurações ativas, preservando as demais variáveis do .env
+    _, current_content = load_env()
+    env_vars = {
+        "FALCON_CLIENT_ID": config["FALCON_CLIENT_ID"],
+        "FALCON_CLIENT_SECRET": config["FALCON_CLIENT_SECRET"],
+        "FALCON_BASE_URL": config["FALCON_BASE_URL"],
+        "CLIENT_NAME": client_name,
+    }
+    env_vars.update({k: v for k, v in current_content.items() if k not in env_vars})
 
     # Regrava o .env com CLIENT_CONFIGS mantido
-    all_configs = load_client_configs()
-    with open(ENV_FILE, "w", encoding="utf-8") as f:
-        f.write(f"CLIENT_CONFIGS={json.dumps(all_configs)}\n")
-        f.write("\n".join(env_content))
+    lines = [f"CLIENT_CONFIGS={dumps(client_configs)}"]
+    lines.extend(f"{k}={v}" for k, v in env_vars.items())
+    _write_env("\n".join(lines) + "\n")
+    _update_cache(client_configs, env_vars)
     return True
 
 def clear_screen():
-    os.system("cls" if os.name == "nt" else "clear")
-
-def completer(text, state):
-    global completer_options
-    # Converte o texto de entrada e as opções para minúsculas para ignorar case
-    text = text.lower()
-    options = [opt for opt in completer_options if opt.lower().startswith(text)]
-    if state < len(options):
-        return options[state]
-    else:
+    # Sequência ANSI (limpa a tela e volta o cursor ao início) em vez de abrir um shell a cada menu
+    sys.stdout.write("\x1b[2J\x1b[H")
+    sys.stdout.flush()
+
+def make_completer(options):
+    # Opções ordenadas pela forma minúscula uma vez por prompt, em vez de a cada Tab
+    pairs = sorted((opt.lower(), opt) for opt in options)
+    lowers = [lower for lower, _ in pairs]
+    matches = []
+
+    def completer(text, state):
+        # readline chama com state 0, 1, 2...: as correspondências são calculadas só no primeiro
+        if state == 0:
+            # Converte o texto de entrada para minúsculas para ignorar case
+            text = text.lower()
+            # Busca binária pela primeira opção com o prefixo; as demais vêm logo em seguida
+            matches.clear()
+            i = bisect.bisect_left(lowers, text)
+            while i < len(pairs) and lowers[i].startswith(text):
+                matches.append(pairs[i][1])
+                i += 1
+        if state < len(matches):
+            return matches[state]
         return None
 
+    return completer
+
 def input_with_autocomplete(prompt, options):
-    global completer_options
-    completer_options = options
-    readline.set_completer(completer)
+    readline.set_completer(make_completer(options))
     readline.parse_and_bind("tab: complete")
     user_input = input(prompt)
     readline.set_completer(None)
     return user_input
 
+# Scripts de export já importados (nome do módulo -> módulo)
+_modules = {}
+
 def run_script(script):
     if not os.path.isfile(script):
         print(f"\n❌ Erro: O script '{script}' não foi encontrado na pasta atual.\n")
@@ -111,11 +179,55 @@ def run_script(script):
 
     print(f"\n🚀 Executando {script}...\n")
     try:
-        subprocess.run([sys.executable, script], check=True)
+        # Executa o export no próprio processo. Os scripts leem as credenciais ao serem importados,
+        # então o .env do cliente selecionado é recarregado e o módulo é reimportado a cada execução.
+        load_dotenv(ENV_FILE, override=True)
+        module_name = script[:-3]
+        if module_name in _modules:
+            importlib.reload(_modules[module_name])
+        else:
+            _modules[module_name] = importlib.import_module(module_name)
+        _modules[module_name].main()
         print(f"\n✅ {script} finalizado com sucesso!\n")
-    except subprocess.CalledProcessError as e:
+    except Exception as e:
         print(f"\n❌ Erro ao executar {script}: {e}\n")
 
+def run_export(script):
+    # Executado em um processo separado do Export All: cada export autentica, busca e grava a
+    # planilha de forma independente (o token é compartilhado pelo cache em disco do falcon_client).
+    # Os processos são criados com "spawn", então o módulo é importado do zero com o .env atual,
+    # sem herdar do menu um módulo já importado com as credenciais de outro cliente.
+    # A saída do script é capturada e devolvida, para o menu exibi-la de uma vez, sem misturar
+    # as linhas de exports simultâneos
+    output = io.StringIO()
+    with redirect_stdout(output):
+        load_dotenv(ENV_FILE, override=True)
+        importlib.import_module(script[:-3]).main()
+    return output.getvalue()
+
+def run_all_scripts(scripts):
+    for script in scripts:
+        if not os.path.isfile(script):
+            print(f"\n❌ Erro: O script '{script}' não foi encontrado na pasta atual.\n")
+    scripts = [script for script in scripts if os.path.isfile(script)]
+    if not scripts:
+        return
+
+    workers = min(EXPORT_ALL_WORKERS, len(scripts))
+    print(f"\n🚀 Executando {len(scripts)} exports, {workers} por vez...\n")
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")) as executor:
+        futures = {executor.submit(run_export, script): script for script in scripts}
+        for future in as_completed(futures):
+            script = futures[future]
+            try:
+                output = future.result()
+            except Exception as e:
+                print(f"\n❌ Erro ao executar {script}: {e}\n")
+                continue
+            print(f"===== {script} =====")
+            print(output.rstrip())
+            print(f"🏁 {script} finalizado.\n")
+
 def cadastrar_cliente():
     clear_screen()
     print("===== CRIAR CLIENTE =====")
@@ -125,19 +237,12 @@ def cadastrar_cliente():
 
     while True:
         cloud_choice = input("Digite o Cloud (1 = us-1, 2 = us-2): ").strip()
-        if cloud_choice == "1":
-            cloud = "us-1"
+        cloud = CLOUD_CHOICES.get(cloud_choice)
+        if cloud:
             break
-        elif cloud_choice == "2":
-            cloud = "us-2"
-            break
-        else:
-            print("⚠️ Opção inválida, escolha 1 ou 2.")
+        print("⚠️ Opção inválida, escolha 1 ou 2.")
 
-    falcon_base_url = {
-        "us-1": "https://api.crowdstrike.com",
-        "us-2": "https://api.us-2.crowdstrike.com",
-    }.get(cloud, "https://api.crowdstrike.com")
+    falcon_base_url = FALCON_BASE_URLS[cloud]
 
     client_configs = load_client_configs()
     if client_name in client_configs:
@@ -171,12 +276,10 @@ def editar_cliente(client_configs):
     config = client_configs[client_name]
     client_id = input(f"Client ID atual ({config['FALCON_CLIENT_ID']}): ").strip() or config['FALCON_CLIENT_ID']
     client_secret = input(f"Client Secret atual (***): ").strip() or config['FALCON_CLIENT_SECRET']
-    current_cloud = "us-1" if config['FALCON_BASE_URL'] == "https://api.crowdstrike.com" else "us-2"
+    current_cloud = "us-1" if config['FALCON_BASE_URL'] == FALCON_BASE_URLS["us-1"] else "us-2"
     cloud_choice = input(f"Cloud atual ({current_cloud}): (1 = us-1, 2 = us-2) ").strip() or current_cloud
-    falcon_base_url = {
-        "1": "https://api.crowdstrike.com",
-        "2": "https://api.us-2.crowdstrike.com",
-    }.get(cloud_choice, config['FALCON_BASE_URL'])
+    cloud = CLOUD_CHOICES.get(cloud_choice)
+    falcon_base_url = FALCON_BASE_URLS[cloud] if cloud else config['FALCON_BASE_URL']
 
     client_configs[client_name] = {
         "FALCON_CLIENT_ID": client_id,
@@ -244,9 +347,7 @@ def submenu_exportar(client_configs):
                     continue
                 if update_env_for_client(client_name, client_configs):
                     if escolha == "9":  # ALL
-                        for key, (d, s) in options.items():
-                            if s:  # pula "All"
-                                run_script(s)
+                        run_all_scripts([s for d, s in options.values() if s])  # pula "All"
                     else:
                         run_script(script)
             else:
@@ -315,5 +416,7 @@ def menu_principal():
 
 # Executa o menu principal
 if __name__ == "__main__":
+    if os.name == "nt":
+        os.system("")  # Habilita o processamento de sequências ANSI no console do Windows
     clear_screen()
     menu_principal()
\ No newline at end of file
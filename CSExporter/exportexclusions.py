@@ -7,11 +7,18 @@ Lê credenciais do arquivo .env.
 """
 
 import os, sys
-import pandas as pd
+import logging
 from datetime import datetime, timezone
-import requests
-import json
+from concurrent.futures import ThreadPoolExecutor, as_completed
+try:
+    from orjson import loads
+except ImportError:
+    from json import loads
 from dotenv import load_dotenv
+import falcon_client
+import workbook
+
+log = logging.getLogger(__name__)
 
 # Carrega as variáveis do arquivo .env
 load_dotenv()
@@ -20,119 +27,118 @@ FALCON_CLIENT_SECRET = os.getenv("FALCON_CLIENT_SECRET")
 FALCON_BASE_URL = os.getenv("FALCON_BASE_URL", "https://api.crowdstrike.com")
 CLIENT_NAME = os.getenv("CLIENT_NAME")
 
+DETAILS_BATCH_SIZE = 100  # Máximo de IDs por requisição nos endpoints de detalhes
+MAX_WORKERS = 8  # Requisições em paralelo (páginas e lotes de detalhes)
+
+# Campos lidos de cada tipo de exclusão (created_on vira a coluna created_timestamp)
+CERTIFICATE_FIELDS = ["issuer", "serial", "created_by", "created_on"]
+EXCLUSION_FIELDS = ["value", "created_by", "created_on"]  # value é tratado como string para ML e SV
+IOA_FIELDS = ["name", "ifn_regex", "cl_regex", "created_by", "created_on"]
+
 def get_bearer_token():
     if not all([FALCON_CLIENT_ID, FALCON_CLIENT_SECRET, CLIENT_NAME]):
         raise RuntimeError("FALCON_CLIENT_ID, FALCON_CLIENT_SECRET ou CLIENT_NAME não encontrados no .env")
 
-    auth_url = f"{FALCON_BASE_URL}/oauth2/token"
-    data = {"client_id": FALCON_CLIENT_ID, "client_secret": FALCON_CLIENT_SECRET, "grant_type": "client_credentials"}
-    headers = {"Content-Type": "application/x-www-form-urlencoded"}
-    print(f"Requisição de autenticação - URL: {auth_url}, Data: {data}, Headers: {headers}")  # Depuração
-    resp = requests.post(auth_url, data=data, headers=headers)
-    print(f"Resposta bruta da autenticação: {resp.text}")  # Depuração
-    if resp.status_code != 201:
-        raise RuntimeError(f"Falha na autenticação: {resp.status_code} - {resp.text}")
+    token = falcon_client.get_token(FALCON_BASE_URL, FALCON_CLIENT_ID, FALCON_CLIENT_SECRET)
+    return token, FALCON_BASE_URL, CLIENT_NAME
+
+def fetch_ids_page(url, headers, query_endpoint, offset, limit):
+    params = {"limit": limit, "offset": offset}
+    resp = falcon_client.SESSION.get(url, headers=headers, params=params)
+    falcon_client.debug_response(log, f"IDs for {query_endpoint}, offset {offset}", resp)
+    if resp.status_code != 200:
+        raise RuntimeError(f"Falha ao buscar IDs: {resp.status_code} - {resp.text}")
     try:
-        return resp.json()["access_token"], FALCON_BASE_URL, CLIENT_NAME
+        return loads(resp.content)
     except ValueError:
-        raise RuntimeError(f"Resposta de autenticação inválida: {resp.text}")
+        raise RuntimeError(f"Resposta da API inválida: {resp.text}")
 
 def fetch_ids(token, base_url, query_endpoint):
     url = f"{base_url}{query_endpoint}"
     headers = {"Authorization": f"Bearer {token}"}
-    all_ids = []
-    offset = 0
     limit = 100  # Ajustado para o máximo permitido
 
-    while True:
-        params = {"limit": limit, "offset": offset}
-        resp = requests.get(url, headers=headers, params=params)
-        print(f"Resposta da API (IDs for {query_endpoint}, offset {offset}): {resp.text}")  # Depuração
-        if resp.status_code != 200:
-            raise RuntimeError(f"Falha ao buscar IDs: {resp.status_code} - {resp.text}")
-        try:
-            data = resp.json()
-            resources = data.get("resources", [])
-            all_ids.extend(resources)
-            if not resources or len(resources) < limit:  # Se não houver mais recursos, termina
-                break
-            offset += limit
-        except ValueError:
-            raise RuntimeError(f"Resposta da API inválida: {resp.text}")
-
+    all_ids = []
+    pages = falcon_client.iter_pages(lambda offset: fetch_ids_page(url, headers, query_endpoint, offset, limit), limit, MAX_WORKERS)
+    for page in pages:
+        all_ids.extend(page.get("resources", []))
     return all_ids
 
-def fetch_details(token, base_url, details_endpoint, ids):
+def batches(items, size):
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+def fetch_details_batch(url, headers, details_endpoint, chunk, fields):
+    params = [("ids", id_val) for id_val in chunk]  # Repete o parâmetro ids para cada ID do lote
+    resp = falcon_client.SESSION.get(url, headers=headers, params=params)
+    falcon_client.debug_response(log, f"details for {details_endpoint}, {len(chunk)} IDs", resp)
+    # 400 (lote rejeitado) e 404 (algum ID não encontrado) são tratados abaixo; outros erros
+    # (429, 5xx...) interrompem o export em vez de gerar uma planilha incompleta
+    if resp.status_code not in (200, 400, 404):
+        raise RuntimeError(f"Falha ao buscar detalhes: {resp.status_code} - {resp.text}")
+    try:
+        data = loads(resp.content)
+    except ValueError:
+        raise RuntimeError(f"Resposta da API inválida ({resp.status_code}): {resp.text}")
+    if resp.status_code != 200:
+        # Com vários IDs, a API responde erro se algum não for encontrado, mas devolve os demais em resources
+        print(f"Erro ao buscar detalhes para {len(chunk)} IDs: {resp.status_code} - {data.get('errors')}")
+        # Lote rejeitado por inteiro (ex.: um ID inválido): busca os IDs um a um para não perder os demais
+        if resp.status_code == 400 and len(chunk) > 1:
+            resources = []
+            for id_val in chunk:
+                resources.extend(fetch_details_batch(url, headers, details_endpoint, [id_val], fields))
+            return resources
+    return falcon_client.keep_fields(data.get("resources") or [], fields)
+
+def fetch_details(token, base_url, details_endpoint, ids, fields):
     url = f"{base_url}{details_endpoint}"
     headers = {"Authorization": f"Bearer {token}"}
-    all_details = []
-    
-    # Processar IDs em lotes de 1 pra respeitar o limite de 32 caracteres por ID
-    for id_val in ids:
-        params = {"ids": id_val}  # Passa um ID por vez
-        resp = requests.get(url, headers=headers, params=params)
-        print(f"Resposta da API (details for {details_endpoint}, ID: {id_val}): {resp.text}")  # Depuração
-        if resp.status_code != 200:
-            print(f"Erro ao buscar detalhes para ID {id_val}: {resp.status_code} - {resp.text}")
-            continue
-        try:
-            data = resp.json()
-            resources = data.get("resources", [])
-            all_details.extend(resources)
-        except ValueError:
-            print(f"Resposta da API inválida para ID {id_val}: {resp.text}")
-            continue
 
+    # Busca os IDs em lotes (o limite de 32 caracteres vale para cada ID, não para a requisição)
+    # e dispara os lotes em paralelo
+    chunks = list(batches(ids, DETAILS_BATCH_SIZE))
+    results = [None] * len(chunks)
+    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+        futures = {executor.submit(fetch_details_batch, url, headers, details_endpoint, chunk, fields): i for i, chunk in enumerate(chunks)}
+        for future in as_completed(futures):
+            results[futures[future]] = future.result()
+
+    # Mantém a ordem original dos IDs
+    all_details = []
+    for resources in results:
+        all_details.extend(resources)
     return all_details
 
+def sheet_rows(details, fields):
+    # Cabeçalho e linhas da aba, gravadas direto na planilha; campos ausentes ficam em branco
+    columns = ["created_timestamp" if field == "created_on" else field for field in fields]
+    rows = ([detail.get(field) for field in fields] for detail in details)
+    return columns, rows
+
 def transform_certificate_exclusions(details):
-    data = []
-    for exclusion in details:
-        issuer = exclusion.get("issuer", "")
-        serial = exclusion.get("serial", "")
-        created_by = exclusion.get("created_by", "")
-        created_timestamp = exclusion.get("created_on", "")
-        data.append([issuer, serial, created_by, created_timestamp])
-    df = pd.DataFrame(data, columns=["issuer", "serial", "created_by", "created_timestamp"])
-    return df
+    return sheet_rows(details, CERTIFICATE_FIELDS)
 
 def transform_exclusions(details, type_name):
-    data = []
-    for exclusion in details:
-        value = exclusion.get("value", "")  # Trata como string para ML e SV
-        created_by = exclusion.get("created_by", "")
-        created_timestamp = exclusion.get("created_on", "")
-        data.append([value, created_by, created_timestamp])
-    df = pd.DataFrame(data, columns=["value", "created_by", "created_timestamp"])
-    return df
+    return sheet_rows(details, EXCLUSION_FIELDS)
 
 def transform_ioa_exclusions(details):
-    data = []
-    for exclusion in details:
-        name = exclusion.get("name", "")
-        ifn_regex = exclusion.get("ifn_regex", "")
-        cl_regex = exclusion.get("cl_regex", "")
-        created_by = exclusion.get("created_by", "")
-        created_timestamp = exclusion.get("created_on", "")
-        data.append([name, ifn_regex, cl_regex, created_by, created_timestamp])
-    df = pd.DataFrame(data, columns=["name", "ifn_regex", "cl_regex", "created_by", "created_timestamp"])
-    return df
+    return sheet_rows(details, IOA_FIELDS)
 
 def save_to_excel(per_type, outfile="crowdstrike_exclusions.xlsx"):
     if not outfile.lower().endswith(".xlsx"):
         outfile += ".xlsx"
 
-    meta = pd.DataFrame([{
+    meta = {
         "generated_at_utc": datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ"),
         "tipos_exclusoes": ", ".join(per_type.keys()),
         "total_abas": len(per_type)
-    }])
+    }
 
-    with pd.ExcelWriter(outfile) as writer:
-        for exclusion_type, df in per_type.items():
-            sheet_name = exclusion_type if len(exclusion_type) <= 31 else exclusion_type[:31]
-            df.to_excel(writer, sheet_name=sheet_name, index=False)
-        meta.to_excel(writer, sheet_name="Meta", index=False)
+    with workbook.open_workbook(outfile) as wb:
+        for exclusion_type, (columns, rows) in per_type.items():
+            workbook.write_sheet(wb, exclusion_type, columns, rows)
+        workbook.write_meta(wb, meta)
 
     print(f"✅ Exportado para {outfile} com {len(per_type)} abas (tipos de exclusão)")
 
@@ -146,25 +152,25 @@ def main():
         # 1 - Certificate Based Exclusion
         cert_ids = fetch_ids(token, base_url, "/exclusions/queries/cert-based-exclusions/v1")
         if cert_ids:
-            cert_details = fetch_details(token, base_url, "/exclusions/entities/cert-based-exclusions/v1", cert_ids)
+            cert_details = fetch_details(token, base_url, "/exclusions/entities/cert-based-exclusions/v1", cert_ids, CERTIFICATE_FIELDS)
             per_type["Certificate Based Exclusion"] = transform_certificate_exclusions(cert_details)
 
         # 2 - ML Exclusion
         ml_ids = fetch_ids(token, base_url, "/policy/queries/ml-exclusions/v1")
         if ml_ids:
-            ml_details = fetch_details(token, base_url, "/policy/entities/ml-exclusions/v1", ml_ids)
+            ml_details = fetch_details(token, base_url, "/policy/entities/ml-exclusions/v1", ml_ids, EXCLUSION_FIELDS)
             per_type["ML Exclusion"] = transform_exclusions(ml_details, "ML Exclusion")
 
         # 3 - IOA Exclusion
         ioa_ids = fetch_ids(token, base_url, "/policy/queries/ioa-exclusions/v1")
         if ioa_ids:
-            ioa_details = fetch_details(token, base_url, "/policy/entities/ioa-exclusions/v1", ioa_ids)
+            ioa_details = fetch_details(token, base_url, "/policy/entities/ioa-exclusions/v1", ioa_ids, IOA_FIELDS)
             per_type["IOA Exclusion"] = transform_ioa_exclusions(ioa_details)
 
         # 4 - Sensor Visibility Exclusion
         sv_ids = fetch_ids(token, base_url, "/policy/queries/sv-exclusions/v1")
         if sv_ids:
-            sv_details = fetch_details(token, base_url, "/policy/entities/sv-exclusions/v1", sv_ids)
+            sv_details = fetch_details(token, base_url, "/policy/entities/sv-exclusions/v1", sv_ids, EXCLUSION_FIELDS)
             per_type["Sensor Visibility Exclusion"] = transform_exclusions(sv_details, "Sensor Visibility Exclusion")
 
         if not per_type:
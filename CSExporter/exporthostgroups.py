@@ -9,11 +9,18 @@ O nome do cliente é adicionado ao nome do arquivo exportado.
 """
 
 import os, sys
-import pandas as pd
+import logging
 from datetime import datetime, timezone
-import requests
-import json
+from concurrent.futures import ThreadPoolExecutor
+try:
+    from orjson import loads
+except ImportError:
+    from json import loads
 from dotenv import load_dotenv
+import falcon_client
+import workbook
+
+log = logging.getLogger(__name__)
 
 # Carrega as variáveis do arquivo .env
 load_dotenv()
@@ -22,104 +29,90 @@ FALCON_CLIENT_SECRET = os.getenv("FALCON_CLIENT_SECRET")
 FALCON_BASE_URL = os.getenv("FALCON_BASE_URL", "https://api.crowdstrike.com")
 CLIENT_NAME = os.getenv("CLIENT_NAME")
 
+MAX_WORKERS = 8  # Páginas buscadas em paralelo
+HOST_GROUP_FIELDS = ["name", "assignment_rule"]  # Campos exportados de cada host group
+
 def get_bearer_token():
     if not all([FALCON_CLIENT_ID, FALCON_CLIENT_SECRET, CLIENT_NAME]):
         raise RuntimeError("FALCON_CLIENT_ID, FALCON_CLIENT_SECRET ou CLIENT_NAME não encontrados no .env")
 
-    auth_url = f"{FALCON_BASE_URL}/oauth2/token"
-    data = {"client_id": FALCON_CLIENT_ID, "client_secret": FALCON_CLIENT_SECRET, "grant_type": "client_credentials"}
-    headers = {"Content-Type": "application/x-www-form-urlencoded"}
-    print(f"Requisição de autenticação - URL: {auth_url}, Data: {data}, Headers: {headers}")  # Depuração
-    resp = requests.post(auth_url, data=data, headers=headers)
-    print(f"Resposta bruta da autenticação: {resp.text}")  # Depuração
-    if resp.status_code != 201:
-        raise RuntimeError(f"Falha na autenticação: {resp.status_code} - {resp.text}")
+    token = falcon_client.get_token(FALCON_BASE_URL, FALCON_CLIENT_ID, FALCON_CLIENT_SECRET)
+    return token, FALCON_BASE_URL, CLIENT_NAME
+
+def fetch_host_groups_page(url, headers, offset, limit):
+    params = {"limit": limit, "offset": offset}
+    resp = falcon_client.SESSION.get(url, headers=headers, params=params)
+    falcon_client.debug_response(log, f"host groups, offset {offset}", resp)
+    if resp.status_code != 200:
+        raise RuntimeError(f"Falha ao buscar host groups: {resp.status_code} - {resp.text}")
     try:
-        return resp.json()["access_token"], FALCON_BASE_URL, CLIENT_NAME
+        return loads(resp.content)
     except ValueError:
-        raise RuntimeError(f"Resposta de autenticação inválida: {resp.text}")
+        raise RuntimeError(f"Resposta da API inválida: {resp.text}")
 
 def fetch_host_groups(token, base_url):
     url = f"{base_url}/devices/combined/host-groups/v1"
     headers = {"Authorization": f"Bearer {token}"}
-    all_resources = []
-    offset = 0
     limit = 100  # Ajustado para valor válido (máximo 500)
 
-    while True:
-        params = {"limit": limit, "offset": offset}
-        resp = requests.get(url, headers=headers, params=params)
-        print(f"Resposta da API (host groups, offset {offset}): {resp.text}")  # Depuração
-        if resp.status_code != 200:
-            raise RuntimeError(f"Falha ao buscar host groups: {resp.status_code} - {resp.text}")
-        try:
-            data = resp.json()
-            resources = data.get("resources", [])
-            all_resources.extend(resources)
-            pagination = data.get("meta", {}).get("pagination", {})
-            total = pagination.get("total", 0)
-            if offset + len(resources) >= total:
-                break
-            offset += limit
-        except ValueError:
-            raise RuntimeError(f"Resposta da API inválida: {resp.text}")
-
+    all_resources = []
+    pages = falcon_client.iter_pages(lambda offset: fetch_host_groups_page(url, headers, offset, limit), limit, MAX_WORKERS)
+    for page in pages:
+        all_resources.extend(falcon_client.keep_fields(page.get("resources", []), HOST_GROUP_FIELDS))
     return all_resources
 
 def fetch_total_hosts(token, base_url):
     url = f"{base_url}/devices/combined/devices/v1"
     headers = {"Authorization": f"Bearer {token}"}
     params = {"limit": 1}  # Apenas para obter o total
-    resp = requests.get(url, headers=headers, params=params)
-    print(f"Resposta da API (total hosts): {resp.text}")  # Depuração
+    resp = falcon_client.SESSION.get(url, headers=headers, params=params)
+    falcon_client.debug_response(log, "total hosts", resp)
     if resp.status_code != 200:
         raise RuntimeError(f"Falha ao buscar total de hosts: {resp.status_code} - {resp.text}")
     try:
-        data = resp.json()
+        data = loads(resp.content)
         return data.get("meta", {}).get("pagination", {}).get("total", 0)
     except ValueError:
         raise RuntimeError(f"Resposta da API inválida: {resp.text}")
 
 def transform_host_groups(host_groups, total_hosts):
-    data = []
-    for group in host_groups:
-        name = group.get("name", "Unnamed")
-        assignment_rule = group.get("assignment_rule", "")
-        data.append([name, assignment_rule])
-    
+    rows = [[group.get("name", "Unnamed"), group.get("assignment_rule")] for group in host_groups]
+
     # Adicionar linha de total geral
-    data.append(["Total Geral de Hosts Instalados", total_hosts])
-    
-    df = pd.DataFrame(data, columns=["Host Group", "Assignment Rule"])
-    return df
+    rows.append(["Total Geral de Hosts Instalados", total_hosts])
+    return rows
 
-def save_to_excel(df, outfile="crowdstrike_hostgroups.xlsx"):
+def save_to_excel(rows, outfile="crowdstrike_hostgroups.xlsx"):
     if not outfile.lower().endswith(".xlsx"):
         outfile += ".xlsx"
 
-    meta = pd.DataFrame([{
+    meta = {
         "generated_at_utc": datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ"),
-        "total_host_groups": len(df) - 1,  # Exclui a linha de total geral
-        "total_hosts_instalados": df.iloc[-1]["Assignment Rule"]
-    }])
+        "total_host_groups": len(rows) - 1,  # Exclui a linha de total geral
+        "total_hosts_instalados": rows[-1][1]
+    }
 
-    with pd.ExcelWriter(outfile) as writer:
-        df.to_excel(writer, sheet_name="HostGroups", index=False)
-        meta.to_excel(writer, sheet_name="Meta", index=False)
+    with workbook.open_workbook(outfile) as wb:
+        workbook.write_sheet(wb, "HostGroups", ["Host Group", "Assignment Rule"], rows)
+        workbook.write_meta(wb, meta)
 
-    print(f"✅ Exportado para {outfile} com {len(df) - 1} host groups e total de hosts")
+    print(f"✅ Exportado para {outfile} com {len(rows) - 1} host groups e total de hosts")
 
 def main():
     try:
         token, base_url, client_name = get_bearer_token()
         outfile = f"crowdstrike_hostgroups_{client_name.replace(' ', '_')}.xlsx"
-        host_groups = fetch_host_groups(token, base_url)
-        total_hosts = fetch_total_hosts(token, base_url)
-        df = transform_host_groups(host_groups, total_hosts)
+        # O total de hosts não depende dos host groups: as duas consultas rodam em paralelo
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            groups_future = executor.submit(fetch_host_groups, token, base_url)
+            total_future = executor.submit(fetch_total_hosts, token, base_url)
+            host_groups = groups_future.result()
+            total_hosts = total_future.result()
+        rows = transform_host_groups(host_groups, total_hosts)
         if not host_groups:
             print("Nenhum host group encontrado.")
             return
-        save_to_excel(df, outfile)
+        save_to_excel(rows, outfile)
     except Exception as e:
         print(f"Erro ao executar o script: {e}")
 
@@ -18,11 +18,18 @@ O nome do cliente é adicionado ao nome do arquivo exportado.
 """
 
 import os, sys
-import pandas as pd
+import logging
 from datetime import datetime, timezone
-import requests
-import json
+from concurrent.futures import ThreadPoolExecutor
+try:
+    from orjson import loads
+except ImportError:
+    from json import loads
 from dotenv import load_dotenv
+import falcon_client
+import workbook
+
+log = logging.getLogger(__name__)
 
 # Carrega as variáveis do arquivo .env
 load_dotenv()
@@ -31,52 +38,49 @@ FALCON_CLIENT_SECRET = os.getenv("FALCON_CLIENT_SECRET")
 FALCON_BASE_URL = os.getenv("FALCON_BASE_URL", "https://api.crowdstrike.com")
 CLIENT_NAME = os.getenv("CLIENT_NAME")
 
+DETAILS_BATCH_SIZE = 50  # IDs de grupos de regras por requisição de detalhes
+MAX_WORKERS = 8  # Lotes buscados em paralelo
+
+# field_values exportados, na ordem das colunas 6 a 11
+FIELD_VALUE_COLUMNS = ["ImageFilename", "CommandLine", "ParentImageFilename", "ParentCommandLine", "GrandparentImageFilename", "GrandparentCommandLine"]
+
 def get_bearer_token():
     if not all([FALCON_CLIENT_ID, FALCON_CLIENT_SECRET, CLIENT_NAME]):
         raise RuntimeError("FALCON_CLIENT_ID, FALCON_CLIENT_SECRET ou CLIENT_NAME não encontrados no .env")
 
-    auth_url = f"{FALCON_BASE_URL}/oauth2/token"
-    data = {"client_id": FALCON_CLIENT_ID, "client_secret": FALCON_CLIENT_SECRET, "grant_type": "client_credentials"}
-    headers = {"Content-Type": "application/x-www-form-urlencoded"}
-    print(f"Requisição de autenticação - URL: {auth_url}, Data: {data}, Headers: {headers}")  # Depuração
-    resp = requests.post(auth_url, data=data, headers=headers)
-    print(f"Resposta bruta da autenticação: {resp.text}")  # Depuração
-    if resp.status_code != 201:
-        raise RuntimeError(f"Falha na autenticação: {resp.status_code} - {resp.text}")
-    try:
-        return resp.json()["access_token"], FALCON_BASE_URL, CLIENT_NAME
-    except ValueError:
-        raise RuntimeError(f"Resposta de autenticação inválida: {resp.text}")
+    token = falcon_client.get_token(FALCON_BASE_URL, FALCON_CLIENT_ID, FALCON_CLIENT_SECRET)
+    return token, FALCON_BASE_URL, CLIENT_NAME
 
 def fetch_rule_group_ids(token, base_url):
     url = f"{base_url}/ioarules/queries/rule-groups/v1"
     headers = {"Authorization": f"Bearer {token}"}
     params = {"limit": 500}
-    resp = requests.get(url, headers=headers, params=params)
-    print(f"Resposta da API (rule group IDs): {resp.text}")  # Depuração
+    resp = falcon_client.SESSION.get(url, headers=headers, params=params)
+    falcon_client.debug_response(log, "rule group IDs", resp)
     if resp.status_code != 200:
         raise RuntimeError(f"Falha ao buscar IDs de grupos: {resp.status_code} - {resp.text}")
     try:
-        data = resp.json()
+        data = loads(resp.content)
         return data.get("resources", [])
     except ValueError:
         raise RuntimeError(f"Resposta da API inválida: {resp.text}")
 
-def fetch_rule_details(token, base_url, rule_group_id):
+def fetch_rule_details(token, base_url, rule_group_ids):
     url = f"{base_url}/ioarules/entities/rule-groups/v1"
     headers = {"Authorization": f"Bearer {token}"}
-    params = {"ids": rule_group_id}
-    resp = requests.get(url, headers=headers, params=params)
-    print(f"Resposta da API (rule details for {rule_group_id}): {resp.text}")  # Depuração
+    params = [("ids", rule_group_id) for rule_group_id in rule_group_ids]  # Repete o parâmetro ids para cada ID do lote
+    resp = falcon_client.SESSION.get(url, headers=headers, params=params)
+    falcon_client.debug_response(log, f"rule details for {len(rule_group_ids)} groups", resp)
     if resp.status_code != 200:
         raise RuntimeError(f"Falha ao buscar detalhes da regra: {resp.status_code} - {resp.text}")
     try:
-        data = resp.json()
+        data = loads(resp.content)
         return data.get("resources", [])
     except ValueError:
         raise RuntimeError(f"Resposta da API inválida: {resp.text}")
 
 def transform_rules(rule_details):
+    import pandas as pd  # Import local: o pandas só é carregado quando o export chega à transformação
     data = []
     for rule_group in rule_details:
         for rule in rule_group.get("rules", []):
@@ -86,32 +90,29 @@ def transform_rules(rule_details):
             action_label = rule.get("action_label", "")
             ruletype_name = rule.get("ruletype_name", "")
 
-            # Extrair field_values
-            field_values = rule.get("field_values", [])
-            image_filename = next((fv.get("values", [{}])[0].get("value", "") for fv in field_values if fv.get("name") == "ImageFilename"), "")
-            command_line = next((fv.get("values", [{}])[0].get("value", "") for fv in field_values if fv.get("name") == "CommandLine"), "")
-            parent_image_filename = next((fv.get("values", [{}])[0].get("value", "") for fv in field_values if fv.get("name") == "ParentImageFilename"), "")
-            parent_command_line = next((fv.get("values", [{}])[0].get("value", "") for fv in field_values if fv.get("name") == "ParentCommandLine"), "")
-            grandparent_image_filename = next((fv.get("values", [{}])[0].get("value", "") for fv in field_values if fv.get("name") == "GrandparentImageFilename"), "")
-            grandparent_command_line = next((fv.get("values", [{}])[0].get("value", "") for fv in field_values if fv.get("name") == "GrandparentCommandLine"), "")
+            # Extrair field_values: um dict nome -> primeiro valor, montado em uma única passada
+            field_values = {}
+            for fv in rule.get("field_values", []):
+                field_values.setdefault(fv.get("name"), (fv.get("values") or [{}])[0].get("value", ""))
 
-            data.append([name, description, pattern_severity, action_label, ruletype_name, image_filename, command_line, parent_image_filename, parent_command_line, grandparent_image_filename, grandparent_command_line])
+            data.append([name, description, pattern_severity, action_label, ruletype_name]
+                        + [field_values.get(field, "") for field in FIELD_VALUE_COLUMNS])
 
-    df = pd.DataFrame(data, columns=["name", "description", "pattern_severity", "action_label", "ruletype_name", "ImageFilename", "CommandLine", "ParentImageFilename", "ParentCommandLine", "GrandparentImageFilename", "GrandparentCommandLine"])
+    df = pd.DataFrame(data, columns=["name", "description", "pattern_severity", "action_label", "ruletype_name"] + FIELD_VALUE_COLUMNS)
     return df
 
 def save_to_excel(df, outfile="crowdstrike_ioa_rules.xlsx"):
     if not outfile.lower().endswith(".xlsx"):
         outfile += ".xlsx"
 
-    meta = pd.DataFrame([{
+    meta = {
         "generated_at_utc": datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ"),
         "total_rules": len(df)
-    }])
+    }
 
-    with pd.ExcelWriter(outfile) as writer:
-        df.to_excel(writer, sheet_name="IOARules", index=False)
-        meta.to_excel(writer, sheet_name="Meta", index=False)
+    with workbook.open_workbook(outfile) as wb:
+        workbook.write_sheet(wb, "IOARules", list(df.columns), workbook.dataframe_rows(df))
+        workbook.write_meta(wb, meta)
 
     print(f"✅ Exportado para {outfile} com {len(df)} regras")
 
@@ -120,10 +121,12 @@ def main():
         token, base_url, client_name = get_bearer_token()
         outfile = f"crowdstrike_ioa_rules_{client_name.replace(' ', '_')}.xlsx"
         rule_group_ids = fetch_rule_group_ids(token, base_url)
+        chunks = [rule_group_ids[i:i + DETAILS_BATCH_SIZE] for i in range(0, len(rule_group_ids), DETAILS_BATCH_SIZE)]
         all_rule_details = []
-        for rule_group_id in rule_group_ids:
-            rule_details = fetch_rule_details(token, base_url, rule_group_id)
-            all_rule_details.extend(rule_details)
+        with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+            results = executor.map(lambda chunk: fetch_rule_details(token, base_url, chunk), chunks)
+            for rule_details in results:  # map devolve os lotes na ordem dos IDs
+                all_rule_details.extend(rule_details)
         df = transform_rules(all_rule_details)
         if not df.empty:
             save_to_excel(df, outfile)
@@ -11,11 +11,17 @@ O nome do cliente é adicionado ao nome do arquivo exportado.
 """
 
 import os, sys
-import pandas as pd
+import logging
 from datetime import datetime, timezone
-import requests
-import json
+try:
+    from orjson import loads
+except ImportError:
+    from json import loads
 from dotenv import load_dotenv
+import falcon_client
+import workbook
+
+log = logging.getLogger(__name__)
 
 # Carrega as variáveis do arquivo .env
 load_dotenv()
@@ -24,89 +30,79 @@ FALCON_CLIENT_SECRET = os.getenv("FALCON_CLIENT_SECRET")
 FALCON_BASE_URL = os.getenv("FALCON_BASE_URL", "https://api.crowdstrike.com")
 CLIENT_NAME = os.getenv("CLIENT_NAME")
 
+MAX_WORKERS = 8  # Páginas buscadas em paralelo
+
 def get_bearer_token():
     if not all([FALCON_CLIENT_ID, FALCON_CLIENT_SECRET, CLIENT_NAME]):
         raise RuntimeError("FALCON_CLIENT_ID, FALCON_CLIENT_SECRET ou CLIENT_NAME não encontrados no .env")
 
-    auth_url = f"{FALCON_BASE_URL}/oauth2/token"
-    data = {"client_id": FALCON_CLIENT_ID, "client_secret": FALCON_CLIENT_SECRET, "grant_type": "client_credentials"}
-    headers = {"Content-Type": "application/x-www-form-urlencoded"}
-    print(f"Requisição de autenticação - URL: {auth_url}, Data: {data}, Headers: {headers}")  # Depuração
-    resp = requests.post(auth_url, data=data, headers=headers)
-    print(f"Resposta bruta da autenticação: {resp.text}")  # Depuração
-    if resp.status_code != 201:
-        raise RuntimeError(f"Falha na autenticação: {resp.status_code} - {resp.text}")
+    token = falcon_client.get_token(FALCON_BASE_URL, FALCON_CLIENT_ID, FALCON_CLIENT_SECRET)
+    return token, FALCON_BASE_URL, CLIENT_NAME
+
+def fetch_iocs_page(url, headers, offset, limit):
+    params = {"limit": limit, "offset": offset}
+    resp = falcon_client.SESSION.get(url, headers=headers, params=params)
+    falcon_client.debug_response(log, f"offset {offset}", resp)
+    if resp.status_code != 200:
+        raise RuntimeError(f"Falha ao buscar IOCs: {resp.status_code} - {resp.text}")
     try:
-        return resp.json()["access_token"], FALCON_BASE_URL, CLIENT_NAME
+        return loads(resp.content)
     except ValueError:
-        raise RuntimeError(f"Resposta de autenticação inválida: {resp.text}")
+        raise RuntimeError(f"Resposta da API inválida: {resp.text}")
+
+def ioc_record(ioc):
+    # Reduz um IOC às colunas exportadas: (type, value, original_filename, action, platforms)
+    platforms = ioc.get("platforms", "")
+    return (
+        ioc.get("type") or "Unknown",  # type nulo também vira Unknown, para o groupby não descartar o IOC
+        ioc.get("value", ""),
+        (ioc.get("metadata") or {}).get("original_filename", ""),
+        ioc.get("action", ""),
+        ", ".join(platforms) if isinstance(platforms, list) else platforms,
+    )
 
 def fetch_iocs(token, base_url):
     url = f"{base_url}/iocs/combined/indicator/v1"
     headers = {"Authorization": f"Bearer {token}"}
-    all_resources = []
-    offset = 0
     limit = 2000  # Máximo permitido
 
-    while True:
-        params = {"limit": limit, "offset": offset}
-        resp = requests.get(url, headers=headers, params=params)
-        print(f"Resposta da API (offset {offset}): {resp.text}")  # Depuração
-        if resp.status_code != 200:
-            raise RuntimeError(f"Falha ao buscar IOCs: {resp.status_code} - {resp.text}")
-        try:
-            data = resp.json()
-            resources = data.get("resources", [])
-            all_resources.extend(resources)
-            if not resources or len(resources) < limit:  # Se não houver mais recursos, termina
-                break
-            offset += limit
-        except ValueError:
-            raise RuntimeError(f"Resposta da API inválida: {resp.text}")
-
-    return all_resources
-
-def transform_iocs(iocs):
+    # Cada página vira registros assim que chega, e o JSON decodificado dela é liberado em seguida
+    records = []
+    pages = falcon_client.iter_pages(lambda offset: fetch_iocs_page(url, headers, offset, limit), limit, MAX_WORKERS)
+    for page in pages:
+        records.extend(ioc_record(ioc) for ioc in page.get("resources", []))
+    return records
+
+def transform_iocs(records):
     """
-    Retorna dict: {type: DataFrame}, onde:
+    Retorna dict: {type: DataFrame}, a partir dos registros de ioc_record, onde:
     - coluna 1 = value (hash ou url)
     - coluna 2 = original_filename (dentro de metadata)
     - coluna 3 = action
     - coluna 4 = platforms
     """
-    per_type = {}
-    for ioc in iocs:
-        ioc_type = ioc.get("type", "Unknown")
-        if ioc_type not in per_type:
-            per_type[ioc_type] = []
-        value = ioc.get("value", "")
-        original_filename = ioc.get("metadata", {}).get("original_filename", "")
-        action = ioc.get("action", "")
-        platforms = ", ".join(ioc.get("platforms", [])) if isinstance(ioc.get("platforms"), list) else ioc.get("platforms", "")
-        per_type[ioc_type].append([value, original_filename, action, platforms])
-
-    # Transformar em DataFrame por type
-    result = {}
-    for ioc_type, ioc_list in per_type.items():
-        df = pd.DataFrame(ioc_list, columns=["value", "original_filename", "action", "platforms"])
-        result[ioc_type] = df
-    return result
+    if not records:
+        return {}
+    import pandas as pd  # Import local: o pandas só é carregado quando o export chega à transformação
+    df = pd.DataFrame.from_records(records, columns=["type", "value", "original_filename", "action", "platforms"])
+
+    # Uma aba por type, na ordem em que cada type aparece
+    return {ioc_type: group.drop(columns="type") for ioc_type, group in df.groupby("type", sort=False)}
 
 def save_to_excel(per_type, outfile="crowdstrike_iocs.xlsx"):
     if not outfile.lower().endswith(".xlsx"):
         outfile += ".xlsx"
 
-    meta = pd.DataFrame([{
+    meta = {
         "generated_at_utc": datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ"),
         "tipos_iocs": ", ".join(per_type.keys()),
         "total_abas": len(per_type)
-    }])
+    }
 
-    with pd.ExcelWriter(outfile) as writer:
+    with workbook.open_workbook(outfile) as wb:
         for ioc_type, df in per_type.items():
-            sheet_name = ioc_type if len(ioc_type) <= 31 else ioc_type[:31]
-            df.to_excel(writer, sheet_name=sheet_name, index=False)
-        meta.to_excel(writer, sheet_name="Meta", index=False)
+            workbook.write_sheet(wb, ioc_type, list(df.columns), workbook.dataframe_rows(df))
+        workbook.write_meta(wb, meta)
 
     print(f"✅ Exportado para {outfile} com {len(per_type)} abas (tipos de IOC)")
 
@@ -114,8 +110,8 @@ def main():
     try:
         token, base_url, client_name = get_bearer_token()
         outfile = f"crowdstrike_iocs_{client_name.replace(' ', '_')}.xlsx"
-        iocs = fetch_iocs(token, base_url)
-        per_type = transform_iocs(iocs)
+        records = fetch_iocs(token, base_url)
+        per_type = transform_iocs(records)
         if not per_type:
             print("Nenhum IOC encontrado.")
             return
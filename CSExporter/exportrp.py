@@ -9,11 +9,11 @@ O nome do cliente é adicionado ao nome do arquivo exportado.
 """
 
 import os, sys
-import pandas as pd
+from collections import defaultdict
 from datetime import datetime, timezone
-import requests
-import json
 from dotenv import load_dotenv
+import falcon_client
+import workbook
 
 # Carrega as variáveis do arquivo .env
 load_dotenv()
@@ -22,74 +22,50 @@ FALCON_CLIENT_SECRET = os.getenv("FALCON_CLIENT_SECRET")
 FALCON_BASE_URL = os.getenv("FALCON_BASE_URL", "https://api.crowdstrike.com")
 CLIENT_NAME = os.getenv("CLIENT_NAME")
 
+POLICY_FIELDS = ["name", "platform_name", "settings"]  # Campos lidos de cada política
+
 def get_bearer_token():
     if not all([FALCON_CLIENT_ID, FALCON_CLIENT_SECRET, CLIENT_NAME]):
         raise RuntimeError("FALCON_CLIENT_ID, FALCON_CLIENT_SECRET ou CLIENT_NAME não encontrados no .env")
 
-    auth_url = f"{FALCON_BASE_URL}/oauth2/token"
-    data = {"client_id": FALCON_CLIENT_ID, "client_secret": FALCON_CLIENT_SECRET, "grant_type": "client_credentials"}
-    headers = {"Content-Type": "application/x-www-form-urlencoded"}
-    print(f"Requisição de autenticação - URL: {auth_url}, Data: {data}, Headers: {headers}")  # Depuração
-    resp = requests.post(auth_url, data=data, headers=headers)
-    print(f"Resposta bruta da autenticação: {resp.text}")  # Depuração
-    if resp.status_code != 201:
-        raise RuntimeError(f"Falha na autenticação: {resp.status_code} - {resp.text}")
-    try:
-        return resp.json()["access_token"], FALCON_BASE_URL, CLIENT_NAME
-    except ValueError:
-        raise RuntimeError(f"Resposta de autenticação inválida: {resp.text}")
+    token = falcon_client.get_token(FALCON_BASE_URL, FALCON_CLIENT_ID, FALCON_CLIENT_SECRET)
+    return token, FALCON_BASE_URL, CLIENT_NAME
 
 def fetch_policies(token, base_url):
-    url = f"{base_url}/policy/combined/response/v1"
-    headers = {"Authorization": f"Bearer {token}"}
-    params = {"limit": 5000}
-    resp = requests.get(url, headers=headers, params=params)
-    print(f"Resposta da API (status: {resp.status_code}): {resp.text}")  # Depuração
-    if resp.status_code != 200:
-        raise RuntimeError(f"Falha ao buscar políticas: {resp.status_code} - {resp.text}")
-    try:
-        data = resp.json()
-        return data.get("resources", [])
-    except ValueError:
-        raise RuntimeError(f"Resposta da API inválida: {resp.text}")
+    return falcon_client.fetch_policies(token, base_url, "/policy/combined/response/v1", POLICY_FIELDS, "response policies")
+
+def enabled_value(setting):
+    # value.enabled, que em alguns motores vem aninhado em um segundo enabled; value ausente ou nulo = Disabled
+    value = setting.get("value")
+    enabled = value.get("enabled", False) if isinstance(value, dict) else False
+    if isinstance(enabled, dict):
+        enabled = enabled.get("enabled", False)
+    return "Enabled" if enabled else "Disabled"
 
 def transform_policies(policies):
     """
-    Retorna dict: {SO: DataFrame}, onde:
+    Retorna dict: {SO: (colunas, linhas)}, onde:
     - primeira coluna = nomes dos motores (de settings.settings.name)
     - colunas seguintes = políticas com valores de enabled (de value.enabled)
     - ignora plataformas Mobile e Meta
     """
-    per_so_policy_configs = {}
+    per_so_policy_configs = defaultdict(dict)
     for pol in policies:
         so = pol.get("platform_name", "Unknown")
         if so in ["Mobile", "Meta"]:
             continue  # ignora plataformas Mobile e Meta
 
-        if so not in per_so_policy_configs:
-            per_so_policy_configs[so] = {}
-
         policy_name = pol.get("name", "Unnamed")  # Nome da política vem do atributo name
-        settings = pol.get("settings", [])
-        config_values = {}
-        for setting_group in settings:
-            for setting in setting_group.get("settings", []):
-                motor_name = setting.get("name", "")
-                enabled = setting.get("value", {}).get("enabled", False)
-                if isinstance(enabled, dict):
-                    enabled = enabled.get("enabled", False)
-                config_values[motor_name] = "Enabled" if enabled else "Disabled"
-        per_so_policy_configs[so][policy_name] = config_values
-
-    # Criar DataFrame por SO
+        # Settings de todos os grupos em uma única sequência
+        settings = (s for setting_group in pol.get("settings", []) for s in setting_group.get("settings", []))
+        per_so_policy_configs[so][policy_name] = {s.get("name", ""): enabled_value(s) for s in settings}
+
+    # Linhas por SO, sem montar DataFrame
     per_os = {}
     for so, policy_configs in per_so_policy_configs.items():
-        motors = set()
-        for config_dict in policy_configs.values():
-            motors.update(config_dict.keys())
-        data = {policy_name: [config_dict.get(motor, "") for motor in motors] for policy_name, config_dict in policy_configs.items()}
-        df = pd.DataFrame(data, index=list(motors))
-        per_os[so] = df
+        # Motores na ordem em que aparecem nas políticas, sem repetição
+        motors = dict.fromkeys(motor for config_dict in policy_configs.values() for motor in config_dict)
+        per_os[so] = workbook.policy_rows(policy_configs, motors)
 
     return per_os
 
@@ -97,17 +73,16 @@ def save_to_excel(per_os, outfile="crowdstrike_response_policies.xlsx"):
     if not outfile.lower().endswith(".xlsx"):
         outfile += ".xlsx"
 
-    meta = pd.DataFrame([{
+    meta = {
         "generated_at_utc": datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ"),
         "sistemas_operacionais": ", ".join(per_os.keys()),
         "total_abas": len(per_os)
-    }])
+    }
 
-    with pd.ExcelWriter(outfile) as writer:
-        for so, df in per_os.items():
-            sheet_name = so if len(so) <= 31 else so[:31]
-            df.to_excel(writer, sheet_name=sheet_name, index=True)
-        meta.to_excel(writer, sheet_name="Meta", index=False)
+    with workbook.open_workbook(outfile) as wb:
+        for so, (columns, rows) in per_os.items():
+            workbook.write_sheet(wb, so, columns, rows)
+        workbook.write_meta(wb, meta)
 
     print(f"✅ Exportado para {outfile} com {len(per_os)} abas (SO)")
 
@@ -8,11 +8,11 @@ O nome do cliente é adicionado ao nome do arquivo exportado.
 """
 
 import os, sys
-import pandas as pd
+from collections import defaultdict
 from datetime import datetime, timezone
-import requests
-import json
 from dotenv import load_dotenv
+import falcon_client
+import workbook
 
 # Carrega as variáveis do arquivo .env
 load_dotenv()
@@ -21,91 +21,67 @@ FALCON_CLIENT_SECRET = os.getenv("FALCON_CLIENT_SECRET")
 FALCON_BASE_URL = os.getenv("FALCON_BASE_URL", "https://api.crowdstrike.com")
 CLIENT_NAME = os.getenv("CLIENT_NAME")
 
+POLICY_FIELDS = ["name", "platform_name", "settings", "uninstall_protection"]  # Campos lidos de cada política
+SHEET_COLUMNS = ["name", "build", "uninstall_protection"]  # Colunas de cada aba, uma política por linha
+
 def get_bearer_token():
     if not all([FALCON_CLIENT_ID, FALCON_CLIENT_SECRET, CLIENT_NAME]):
         raise RuntimeError("FALCON_CLIENT_ID, FALCON_CLIENT_SECRET ou CLIENT_NAME não encontrados no .env")
 
-    auth_url = f"{FALCON_BASE_URL}/oauth2/token"
-    data = {"client_id": FALCON_CLIENT_ID, "client_secret": FALCON_CLIENT_SECRET, "grant_type": "client_credentials"}
-    headers = {"Content-Type": "application/x-www-form-urlencoded"}
-    print(f"Requisição de autenticação - URL: {auth_url}, Data: {data}, Headers: {headers}")  # Depuração
-    resp = requests.post(auth_url, data=data, headers=headers)
-    print(f"Resposta bruta da autenticação: {resp.text}")  # Depuração
-    if resp.status_code != 201:
-        raise RuntimeError(f"Falha na autenticação: {resp.status_code} - {resp.text}")
-    try:
-        return resp.json()["access_token"], FALCON_BASE_URL, CLIENT_NAME
-    except ValueError:
-        raise RuntimeError(f"Resposta de autenticação inválida: {resp.text}")
+    token = falcon_client.get_token(FALCON_BASE_URL, FALCON_CLIENT_ID, FALCON_CLIENT_SECRET)
+    return token, FALCON_BASE_URL, CLIENT_NAME
 
 def fetch_policies(token, base_url):
-    url = f"{base_url}/policy/combined/sensor-update/v2"
-    headers = {"Authorization": f"Bearer {token}"}
-    params = {"limit": 5000}
-    resp = requests.get(url, headers=headers, params=params)
-    print(f"Resposta da API (status: {resp.status_code}): {resp.text}")  # Depuração
-    if resp.status_code != 200:
-        raise RuntimeError(f"Falha ao buscar políticas: {resp.status_code} - {resp.text}")
-    try:
-        data = resp.json()
-        return data.get("resources", [])
-    except ValueError:
-        raise RuntimeError(f"Resposta da API inválida: {resp.text}")
+    return falcon_client.fetch_policies(token, base_url, "/policy/combined/sensor-update/v2", POLICY_FIELDS, "sensor update policies")
 
 def transform_policies(policies):
     """
-    Retorna dict: {SO: DataFrame}, onde:
+    Retorna dict: {SO: linhas}, onde:
     - linhas = políticas
     - colunas = name, build, uninstall_protection
     - valores = configurações específicas
     - ignora plataformas Mobile e Meta
     """
-    per_os = {}
+    per_os = defaultdict(list)
     for pol in policies:
         so = pol.get("platform_name", "Unknown")
         if so in ["Mobile", "Meta"]:
             continue  # ignora plataformas Mobile e Meta
 
         pol_name = pol.get("name", "Unnamed")
-        build = pol.get("settings", {}).get("build", "")
-        # Extrair apenas N, N-1 ou N-2 da string de build
-        if build:
-            if "n" in build.lower():
-                if "n-2" in build.lower():
+        settings = pol.get("settings") or {}
+        build = settings.get("build") or ""
+        # Extrair apenas N, N-1 ou N-2 da string de build; outros valores ficam como estão
+        if isinstance(build, str) and build:
+            build_lower = build.lower()
+            if "n" in build_lower:
+                if "n-2" in build_lower:
                     build = "N-2"
-                elif "n-1" in build.lower():
+                elif "n-1" in build_lower:
                     build = "N-1"
                 else:
                     build = "N"
-        uninstall_protection = pol.get("settings", {}).get("uninstall_protection", pol.get("uninstall_protection", ""))
+        uninstall_protection = settings.get("uninstall_protection", pol.get("uninstall_protection", ""))
         if isinstance(uninstall_protection, bool):
             uninstall_protection = "Enabled" if uninstall_protection else "Disabled"
-        if so not in per_os:
-            per_os[so] = []
-        per_os[so].append({"name": pol_name, "build": build, "uninstall_protection": uninstall_protection})
+        per_os[so].append((pol_name, build, uninstall_protection))
 
-    # Transformar em DataFrame
-    result = {}
-    for so, policies_list in per_os.items():
-        df = pd.DataFrame(policies_list)
-        result[so] = df
-    return result
+    return dict(per_os)
 
 def save_to_excel(per_os, outfile="crowdstrike_sensor_update_policies.xlsx"):
     if not outfile.lower().endswith(".xlsx"):
         outfile += ".xlsx"
 
-    meta = pd.DataFrame([{
+    meta = {
         "generated_at_utc": datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ"),
         "sistemas_operacionais": ", ".join(per_os.keys()),
         "total_abas": len(per_os)
-    }])
+    }
 
-    with pd.ExcelWriter(outfile) as writer:
-        for so, df in per_os.items():
-            sheet_name = so if len(so) <= 31 else so[:31]
-            df.to_excel(writer, sheet_name=sheet_name, index=False)
-        meta.to_excel(writer, sheet_name="Meta", index=False)
+    with workbook.open_workbook(outfile) as wb:
+        for so, rows in per_os.items():
+            workbook.write_sheet(wb, so, SHEET_COLUMNS, rows)
+        workbook.write_meta(wb, meta)
 
     print(f"✅ Exportado para {outfile} com {len(per_os)} abas (SO)")
 
@@ -11,11 +11,11 @@ O nome do cliente é adicionado ao nome do arquivo exportado.
 """
 
 import os, sys
-import pandas as pd
+from collections import defaultdict
 from datetime import datetime, timezone
-import requests
-import json
 from dotenv import load_dotenv
+import falcon_client
+import workbook
 
 # Carrega as variáveis do arquivo .env
 load_dotenv()
@@ -24,53 +24,31 @@ FALCON_CLIENT_SECRET = os.getenv("FALCON_CLIENT_SECRET")
 FALCON_BASE_URL = os.getenv("FALCON_BASE_URL", "https://api.crowdstrike.com")
 CLIENT_NAME = os.getenv("CLIENT_NAME")
 
+POLICY_FIELDS = ["name", "platform_name", "settings"]  # Campos lidos de cada política
+
 def get_bearer_token():
     if not all([FALCON_CLIENT_ID, FALCON_CLIENT_SECRET, CLIENT_NAME]):
         raise RuntimeError("FALCON_CLIENT_ID, FALCON_CLIENT_SECRET ou CLIENT_NAME não encontrados no .env")
 
-    auth_url = f"{FALCON_BASE_URL}/oauth2/token"
-    data = {"client_id": FALCON_CLIENT_ID, "client_secret": FALCON_CLIENT_SECRET, "grant_type": "client_credentials"}
-    headers = {"Content-Type": "application/x-www-form-urlencoded"}
-    print(f"Requisição de autenticação - URL: {auth_url}, Data: {data}, Headers: {headers}")  # Depuração
-    resp = requests.post(auth_url, data=data, headers=headers)
-    print(f"Resposta bruta da autenticação: {resp.text}")  # Depuração
-    if resp.status_code != 201:
-        raise RuntimeError(f"Falha na autenticação: {resp.status_code} - {resp.text}")
-    try:
-        return resp.json()["access_token"], FALCON_BASE_URL, CLIENT_NAME
-    except ValueError:
-        raise RuntimeError(f"Resposta de autenticação inválida: {resp.text}")
+    token = falcon_client.get_token(FALCON_BASE_URL, FALCON_CLIENT_ID, FALCON_CLIENT_SECRET)
+    return token, FALCON_BASE_URL, CLIENT_NAME
 
 def fetch_policies(token, base_url):
-    url = f"{base_url}/policy/combined/device-control/v1"
-    headers = {"Authorization": f"Bearer {token}"}
-    params = {"limit": 5000}
-    resp = requests.get(url, headers=headers, params=params)
-    print(f"Resposta da API (status: {resp.status_code}): {resp.text}")  # Depuração
-    if resp.status_code != 200:
-        raise RuntimeError(f"Falha ao buscar políticas: {resp.status_code} - {resp.text}")
-    try:
-        data = resp.json()
-        return data.get("resources", [])
-    except ValueError:
-        raise RuntimeError(f"Resposta da API inválida: {resp.text}")
+    return falcon_client.fetch_policies(token, base_url, "/policy/combined/device-control/v1", POLICY_FIELDS, "device control policies")
 
 def transform_policies(policies):
     """
-    Retorna dict: {SO: DataFrame}, onde:
+    Retorna dict: {SO: (colunas, linhas)}, onde:
     - coluna 1 = nome do motor/configuração (enforcement_mode, end_user_notification, classes.id)
     - colunas 2 em diante = políticas com valores de configuração (action ou valor do atributo)
     - ignora plataformas Mobile e Meta
     """
-    per_so_policy_configs = {}
+    per_so_policy_configs = defaultdict(dict)
     for pol in policies:
         so = pol.get("platform_name", "Unknown")
         if so in ["Mobile", "Meta"]:
             continue  # ignora plataformas Mobile e Meta
 
-        if so not in per_so_policy_configs:
-            per_so_policy_configs[so] = {}
-
         policy_name = pol.get("name", "Unnamed")  # Nome da política vem do atributo name
         settings = pol.get("settings", {})
         config_values = {}
@@ -93,15 +71,13 @@ def transform_policies(policies):
 
         per_so_policy_configs[so][policy_name] = config_values
 
-    # Criar DataFrame por SO
+    # Linhas por SO, sem montar DataFrame
     per_os = {}
     for so, policy_configs in per_so_policy_configs.items():
-        configs = ["enforcement_mode", "end_user_notification"]
-        for config_dict in policy_configs.values():
-            configs.extend([k for k in config_dict.keys() if k not in configs])
-        data = {policy_name: [config_dict.get(config, "") for config in configs] for policy_name, config_dict in policy_configs.items()}
-        df = pd.DataFrame(data, index=configs)
-        per_os[so] = df
+        # enforcement_mode e end_user_notification primeiro, depois as classes na ordem em que aparecem
+        configs = dict.fromkeys(["enforcement_mode", "end_user_notification"])
+        configs.update(dict.fromkeys(k for config_dict in policy_configs.values() for k in config_dict))
+        per_os[so] = workbook.policy_rows(policy_configs, configs)
 
     return per_os
 
@@ -109,17 +85,16 @@ def save_to_excel(per_os, outfile="crowdstrike_usb_policies.xlsx"):
     if not outfile.lower().endswith(".xlsx"):
         outfile += ".xlsx"
 
-    meta = pd.DataFrame([{
+    meta = {
         "generated_at_utc": datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ"),
         "sistemas_operacionais": ", ".join(per_os.keys()),
         "total_abas": len(per_os)
-    }])
+    }
 
-    with pd.ExcelWriter(outfile) as writer:
-        for so, df in per_os.items():
-            sheet_name = so if len(so) <= 31 else so[:31]
-            df.to_excel(writer, sheet_name=sheet_name, index=True)
-        meta.to_excel(writer, sheet_name="Meta", index=False)
+    with workbook.open_workbook(outfile) as wb:
+        for so, (columns, rows) in per_os.items():
+            workbook.write_sheet(wb, so, columns, rows)
+        workbook.write_meta(wb, meta)
 
     print(f"✅ Exportado para {outfile} com {len(per_os)} abas (SO)")
 
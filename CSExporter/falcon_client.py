@@ -0,0 +1,218 @@
+"""
+Funções compartilhadas pelos scripts de export para acessar a API do CrowdStrike.
+O token OAuth2 fica em cache por (client_id, base_url) até expirar, em memória e em
+~/.cache/csexporter/token.json, então exports executados em sequência (no mesmo processo,
+como no Export All, ou em execuções separadas) autenticam uma única vez.
+Se a API recusar o token (401), ele é descartado dos caches e a requisição é repetida uma vez
+com um token novo.
+"""
+
+import json
+import logging
+import os
+import sys
+import time
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+import requests
+from requests.adapters import HTTPAdapter
+
+try:
+    from orjson import loads
+except ImportError:
+    from json import loads
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+log = logging.getLogger(__name__)
+
+# Saída de depuração (corpos das respostas da API) só com CSEXPORTER_DEBUG=1, enviada ao stderr
+DEBUG = os.getenv("CSEXPORTER_DEBUG") == "1"
+if DEBUG:
+    logging.basicConfig(stream=sys.stderr, level=logging.DEBUG, format="%(name)s: %(message)s")
+
+# Sessão compartilhada para reaproveitar conexões (TCP/TLS) entre as requisições dos exports
+# O requests já envia Accept-Encoding com gzip e deflate, e inclui br quando o pacote brotli está
+# instalado; as respostas compactadas são descompactadas automaticamente
+SESSION = requests.Session()
+SESSION.mount("https://", HTTPAdapter(pool_connections=16, pool_maxsize=16))
+
+# Tokens já emitidos: (client_id, base_url) -> (access_token, expiração em epoch)
+_TOKENS = {}
+# Credenciais de cada token em uso: access_token -> (base_url, client_id, client_secret),
+# para renovar o token quando a API responder 401
+_TOKEN_CREDENTIALS = {}
+# Segundos antes da expiração em que o token é renovado, para não expirar no meio de um export
+TOKEN_REFRESH_MARGIN = 60
+
+# Filtro FQL dos exports de políticas: Mobile e Meta não geram planilha
+POLICY_PLATFORM_FILTER = "platform_name:!'Mobile'+platform_name:!'Meta'"
+
+# Cache em disco compartilhado entre execuções: "client_id@base_url" -> {access_token, expires_at}
+TOKEN_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "csexporter")
+TOKEN_CACHE_FILE = os.path.join(TOKEN_CACHE_DIR, "token.json")
+TOKEN_LOCK_FILE = os.path.join(TOKEN_CACHE_DIR, "token.lock")
+
+@contextmanager
+def _token_cache_lock():
+    # Serializa a renovação entre processos, para que execuções simultâneas não autentiquem em dobro.
+    # Se o diretório de cache não puder ser usado, segue sem trava (e sem cache em disco)
+    try:
+        os.makedirs(TOKEN_CACHE_DIR, mode=0o700, exist_ok=True)
+        lock = open(TOKEN_LOCK_FILE, "a+")
+    except OSError:
+        yield
+        return
+    with lock:
+        if fcntl:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+        else:
+            lock.seek(0)
+            msvcrt.locking(lock.fileno(), msvcrt.LK_LOCK, 1)
+        try:
+            yield
+        finally:
+            if fcntl:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+            else:
+                lock.seek(0)
+                msvcrt.locking(lock.fileno(), msvcrt.LK_UNLCK, 1)
+
+def _read_token_cache():
+    try:
+        with open(TOKEN_CACHE_FILE, "rb") as f:
+            cache = loads(f.read())
+    except (OSError, ValueError):
+        return {}
+    return cache if isinstance(cache, dict) else {}
+
+def _write_token_cache(cache):
+    # Arquivo temporário criado com permissão 0600 e trocado de uma vez pelo cache atual
+    tmp_file = f"{TOKEN_CACHE_FILE}.tmp"
+    try:
+        fd = os.open(tmp_file, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(cache, f)
+        os.replace(tmp_file, TOKEN_CACHE_FILE)
+    except OSError as e:
+        log.debug("Não foi possível gravar o cache de token: %s", e)
+
+def get_token(base_url, client_id, client_secret):
+    key = (client_id, base_url)
+    cached = _TOKENS.get(key)
+    if cached and time.time() < cached[1] - TOKEN_REFRESH_MARGIN:
+        return cached[0]
+
+    with _token_cache_lock():
+        disk_key = f"{client_id}@{base_url}"
+        disk_cache = _read_token_cache()
+        entry = disk_cache.get(disk_key) or {}
+        if entry.get("access_token") and time.time() < entry.get("expires_at", 0) - TOKEN_REFRESH_MARGIN:
+            token, expires_at = entry["access_token"], entry["expires_at"]
+        else:
+            token, expires_at = _request_token(base_url, client_id, client_secret)
+            disk_cache[disk_key] = {"access_token": token, "expires_at": expires_at}
+            _write_token_cache(disk_cache)
+        _TOKENS[key] = (token, expires_at)
+        _TOKEN_CREDENTIALS[token] = (base_url, client_id, client_secret)
+        return token
+
+def invalidate_token(base_url, client_id, token=None):
+    """
+    Remove o token de (client_id, base_url) dos caches em memória e em disco, para que o próximo
+    get_token autentique de novo. Com token, só remove se o cache ainda guardar esse mesmo token
+    (outra requisição em paralelo pode já tê-lo renovado).
+    """
+    key = (client_id, base_url)
+    cached = _TOKENS.get(key)
+    if cached and (token is None or cached[0] == token):
+        del _TOKENS[key]
+    with _token_cache_lock():
+        disk_key = f"{client_id}@{base_url}"
+        disk_cache = _read_token_cache()
+        entry = disk_cache.get(disk_key)
+        if entry and (token is None or entry.get("access_token") == token):
+            del disk_cache[disk_key]
+            _write_token_cache(disk_cache)
+
+def _retry_unauthorized(resp, **kwargs):
+    # Token revogado no servidor (ex.: API client removido ou secret trocado) ainda válido nos caches:
+    # descarta o token, autentica de novo e repete a requisição uma única vez
+    if resp.status_code != 401 or getattr(resp.request, "token_retried", False):
+        return resp
+    token = resp.request.headers.get("Authorization", "").removeprefix("Bearer ")
+    credentials = _TOKEN_CREDENTIALS.get(token)
+    if not credentials:
+        return resp
+    base_url, client_id, client_secret = credentials
+    log.debug("Token recusado (401) para client_id %s; renovando", client_id)
+    invalidate_token(base_url, client_id, token)
+    request = resp.request.copy()
+    request.headers["Authorization"] = f"Bearer {get_token(base_url, client_id, client_secret)}"
+    request.token_retried = True
+    resp.close()
+    return SESSION.send(request, **kwargs)
+
+SESSION.hooks["response"].append(_retry_unauthorized)
+
+def _request_token(base_url, client_id, client_secret):
+    auth_url = f"{base_url}/oauth2/token"
+    data = {"client_id": client_id, "client_secret": client_secret, "grant_type": "client_credentials"}
+    headers = {"Content-Type": "application/x-www-form-urlencoded"}
+    log.debug("Requisição de autenticação - URL: %s, client_id: %s", auth_url, client_id)
+    resp = SESSION.post(auth_url, data=data, headers=headers)
+    log.debug("Resposta da autenticação: %s", resp.status_code)
+    if resp.status_code != 201:
+        raise RuntimeError(f"Falha na autenticação: {resp.status_code} - {resp.text}")
+    try:
+        body = loads(resp.content)
+        token = body["access_token"]
+    except (ValueError, KeyError):
+        raise RuntimeError(f"Resposta de autenticação inválida: {resp.text}")
+
+    return token, time.time() + body.get("expires_in", 0)
+
+def iter_pages(fetch_page, limit, max_workers):
+    """
+    Percorre um endpoint paginado por offset. fetch_page(offset) retorna o JSON de uma página;
+    a primeira informa meta.pagination.total e as demais são buscadas em paralelo.
+    As páginas são devolvidas na ordem dos offsets.
+    """
+    first = fetch_page(0)
+    yield first
+    # meta, pagination ou total podem vir nulos: nesse caso só há a primeira página
+    total = ((first.get("meta") or {}).get("pagination") or {}).get("total") or 0
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        yield from executor.map(fetch_page, range(limit, total, limit))
+
+def debug_response(logger, label, resp):
+    # Evita decodificar o corpo inteiro (resp.text) quando a depuração está desligada
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("Resposta da API (%s): %s", label, resp.text)
+
+def keep_fields(resources, fields):
+    # Mantém só os campos exportados de cada recurso, para que o restante da página decodificada
+    # (listas de grupos, metadados etc.) seja liberado logo após o parse
+    return [{k: r[k] for k in fields if k in r} for r in resources]
+
+def fetch_policies(token, base_url, path, fields, label):
+    """
+    Busca as políticas de um endpoint /policy/combined/* (até 5000, sem Mobile e Meta) e mantém
+    só os campos fields de cada uma; o restante do JSON decodificado é liberado aqui.
+    """
+    url = f"{base_url}{path}"
+    headers = {"Authorization": f"Bearer {token}"}
+    params = {"limit": 5000, "filter": POLICY_PLATFORM_FILTER}
+    resp = SESSION.get(url, headers=headers, params=params)
+    debug_response(log, label, resp)
+    if resp.status_code != 200:
+        raise RuntimeError(f"Falha ao buscar políticas: {resp.status_code} - {resp.text}")
+    try:
+        data = loads(resp.content)
+    except ValueError:
+        raise RuntimeError(f"Resposta da API inválida: {resp.text}")
+    return keep_fields(data.get("resources", []), fields)
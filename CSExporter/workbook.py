@@ -0,0 +1,73 @@
+"""
+Gravação das planilhas Excel em streaming, compartilhada pelos scripts de export.
+As linhas são gravadas uma a uma com o xlsxwriter em modo constant_memory, que
+descarrega cada linha em disco assim que a próxima começa, sem montar DataFrames
+nem manter a planilha inteira em memória.
+"""
+
+import math
+import re
+import xlsxwriter
+
+# Mesmo estilo de cabeçalho usado pelo pandas no to_excel
+HEADER_FORMAT = {"bold": True, "border": 1, "align": "center", "valign": "top"}
+# Caracteres que o Excel não aceita em nomes de aba
+INVALID_SHEET_CHARS = re.compile(r"[\[\]:*?/\\]")
+
+def open_workbook(outfile):
+    # Textos (URLs, regex com "=") são gravados como texto, sem virar hyperlink ou fórmula
+    return xlsxwriter.Workbook(outfile, {
+        "constant_memory": True,
+        "strings_to_urls": False,
+        "strings_to_formulas": False,
+    })
+
+def cell(value):
+    # None e NaN viram célula em branco; listas/dicts são gravados como texto, como no pandas
+    if value is None or (isinstance(value, float) and math.isnan(value)):
+        return None
+    if isinstance(value, (list, dict, tuple, set)):
+        return str(value)
+    return value
+
+def unique_sheet_name(workbook, sheet_name):
+    # Nome válido para a aba: até 31 caracteres, sem []:*?/\, sem apóstrofo no início ou no fim,
+    # não vazio ("Sheet") e diferente (sem considerar maiúsculas) das abas já criadas; em caso de
+    # colisão o final do nome vira _1, _2, ...
+    base = INVALID_SHEET_CHARS.sub("_", str(sheet_name)).strip("'")[:31].rstrip("'") or "Sheet"
+    used = {worksheet.name.lower() for worksheet in workbook.worksheets()}
+    name, n = base, 0
+    while name.lower() in used:
+        n += 1
+        suffix = f"_{n}"
+        name = base[:31 - len(suffix)] + suffix
+    return name
+
+def write_sheet(workbook, sheet_name, columns, rows):
+    """
+    Cria a aba sheet_name (ajustada por unique_sheet_name) com o cabeçalho columns e grava as
+    linhas de rows em ordem. Retorna a quantidade de linhas gravadas, sem contar o cabeçalho.
+    """
+    worksheet = workbook.add_worksheet(unique_sheet_name(workbook, sheet_name))
+    worksheet.write_row(0, 0, columns, workbook.add_format(HEADER_FORMAT))
+    count = 0
+    for count, row in enumerate(rows, 1):
+        worksheet.write_row(count, 0, [cell(value) for value in row])
+    return count
+
+def write_meta(workbook, meta):
+    # Aba Meta: uma coluna por chave do dict, com os valores na segunda linha
+    write_sheet(workbook, "Meta", list(meta.keys()), [list(meta.values())])
+
+def dataframe_rows(df):
+    # Linhas de um DataFrame como tuplas, na ordem das colunas, para write_sheet
+    return df.itertuples(index=False, name=None)
+
+def policy_rows(policy_configs, labels):
+    """
+    Cabeçalho e linhas de uma aba de políticas a partir de {política: {rótulo: valor}}:
+    um rótulo (motor/configuração) por linha, uma política por coluna, "" onde não há valor.
+    """
+    columns = [None] + list(policy_configs)
+    rows = ([label] + [config.get(label, "") for config in policy_configs.values()] for label in labels)
+    return columns, rows